@@ -1,23 +1,76 @@
 from __future__ import annotations
 
 import argparse
+import asyncio
+import hashlib
 import json
+import logging
 import os
+import re
+import shlex
+import string
 import subprocess
 import sys
-from contextlib import redirect_stdout
+from collections.abc import Iterator, Mapping
+from contextlib import contextmanager, redirect_stdout
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
 from pathlib import Path
+from typing import TYPE_CHECKING, Any
 
-import requests
-from openhands.sdk import Conversation, LLM, get_logger
-from openhands.sdk.conversation import get_agent_final_response
-from openhands.tools.preset.default import get_default_agent
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
-logger = get_logger(__name__)
+if TYPE_CHECKING:
+    import httpx
+
+try:
+    import orjson
+except ImportError:  # orjson is an optional speedup; fall back to the stdlib parser.
+    orjson = None
+
+logger = logging.getLogger(__name__)
 
 COMMENT_TAG = "<!-- open-pr-agent-review -->"
 
+# Matches git@github.com:owner/repo.git, https://github.com/owner/repo(.git)(/) and
+# ssh://git@github.com(:port)/owner/repo.git forms.
+_GITHUB_REMOTE_RE = re.compile(r"github\.com(?::\d+)?[:/]([^/]+)/([^/]+?)(?:\.git)?/?$")
+
+# Deleting stale comments is network-bound, so this caps in-flight requests rather than CPU use.
+MAX_CONCURRENT_DELETES = 8
+
+CACHE_DIR = Path(os.getenv("XDG_CACHE_HOME") or Path.home() / ".cache") / "open-pr-agent"
+
+# Remembers when each PR last got a review comment after a full cleanup. It lives in
+# the cache directory so it never shows up as an untracked file in the reviewed repo.
+COMMENT_STATE_PATH = CACHE_DIR / "comment-state.json"
+
+# Part of every cache key; bump it when a change should invalidate previously cached reviews.
+CACHE_VERSION = 1
+
+# Sampling temperature for the review model. Responses are only cached when this is zero.
+REVIEW_TEMPERATURE = 0.0
+
+DIFF_CHUNK_SIZE = 64 * 1024
+
+# Diffs estimated above this many tokens are reviewed file by file instead of in one read.
+DEFAULT_MAX_DIFF_TOKENS = 50_000
+
+# Posted instead of running the agent when the PR diff (minus lock files) is empty.
+NO_CHANGES_REVIEW = "No reviewable changes."
+
+# Pathspecs for lock files the reviewer ignores, both in our own git calls and the agent's.
+DIFF_EXCLUDES = (
+    ":(exclude)package-lock.json",
+    ":(exclude)yarn.lock",
+    ":(exclude)pnpm-lock.yaml",
+    ":(exclude)poetry.lock",
+    ":(exclude)uv.lock",
+    ":(exclude)*.lock",
+)
+
 OPENHANDS_PROMPT = """You are an expert code reviewer. Use bash commands to analyze the PR
 changes and identify issues that need to be addressed.
 
@@ -27,11 +80,9 @@ changes and identify issues that need to be addressed.
 - **Repository**: {repo_name}
 - **Base Branch**: {base_branch}
 - **Head Branch**: {head_branch}
-
+{changed_files_section}
 ## Analysis Process
-Use bash commands to understand the changes. You should start by running:
-`git diff {base_branch}...{head_branch} -- . ':(exclude)package-lock.json' ':(exclude)yarn.lock' ':(exclude)pnpm-lock.yaml' ':(exclude)poetry.lock' ':(exclude)uv.lock' ':(exclude)*.lock'`
-to see the changes introduced by this PR, excluding lock files.
+Use bash commands to understand the changes. {diff_instructions}
 Then examine the code related to the PR. Ignore any other generated artifacts or compiled assets
 even if the PR modifies them—focus on source files and meaningful changes only.
 
@@ -62,6 +113,42 @@ Start by analyzing the changes with bash commands, then provide your structured
 """
 
 
+# OPENHANDS_PROMPT split into (literal, field) pairs once at import, so rendering
+# it is a single join instead of re-parsing the template on every call.
+_PROMPT_PARTS = [
+    (literal, field) for literal, field, _, _ in string.Formatter().parse(OPENHANDS_PROMPT)
+]
+
+
+def format_prompt(values: Mapping[str, str]) -> str:
+    """Render OPENHANDS_PROMPT with ``values``, equivalent to ``str.format``."""
+    return "".join(
+        literal if field is None else literal + values[field] for literal, field in _PROMPT_PARTS
+    )
+
+
+DIFF_INSTRUCTIONS = """You should start by running:
+`{diff_cmd}`
+to see the changes introduced by this PR, excluding lock files."""
+
+LARGE_DIFF_INSTRUCTIONS = """The full diff is too large to read at once (about {tokens} tokens),
+so start by running:
+`{stat_cmd}`
+to see which files changed, excluding lock files. Then read the diff one file at a time,
+most important files first, with:
+`{file_diff_cmd} -- <path>`"""
+
+CHANGED_FILES_SECTION = """
+## Files Changed
+This PR adds, modifies, or renames only the files listed by full path below; untouched
+parts of the repository are collapsed to file counts. Limit your inspection to the listed
+paths instead of exploring unchanged parts of the repository:
+```
+{files}
+```
+"""
+
+
 class Settings(BaseSettings):
     """Load OpenAI-compatible connection details from the environment or a .env file."""
 
@@ -72,6 +159,13 @@ class Settings(BaseSettings):
     api_key: str
 
 
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Load settings once per process; later calls reuse the validated instance."""
+    return Settings()
+
+
+@lru_cache(maxsize=32)
 def _prepare_openhands_model(model_name: str) -> str:
     model_name = model_name.strip()
     if "/" in model_name:
@@ -79,26 +173,68 @@ def _prepare_openhands_model(model_name: str) -> str:
     return f"openai/{model_name}"
 
 
-def _get_git_output(args: list[str]) -> str:
-    try:
-        return subprocess.check_output(args, text=True).strip()
-    except subprocess.CalledProcessError:
-        return ""
+def _json_loads(data: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _json_dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode("utf-8")
+
+
+def _get_git_outputs(*commands: list[str]) -> list[str | None]:
+    """Run independent git queries concurrently and return their stripped stdout.
+
+    All processes are spawned before any is waited on, so the fork/exec and
+    repository setup cost of each query overlaps instead of adding up. Output
+    is read as bytes and decoded as UTF-8 only for successful commands, rather
+    than through the locale codec, which could fail on non-UTF-8 path names.
+    A command that cannot be run or exits non-zero yields None, so callers can
+    tell a failure apart from empty output.
+    """
+    procs = []
+    for args in commands:
+        try:
+            procs.append(subprocess.Popen(args, stdout=subprocess.PIPE))
+        except OSError:
+            procs.append(None)
 
+    outputs: list[str | None] = []
+    for proc in procs:
+        if proc is None:
+            outputs.append(None)
+            continue
+        stdout, _ = proc.communicate()
+        outputs.append(stdout.strip().decode("utf-8", "replace") if proc.returncode == 0 else None)
+    return outputs
 
-def _load_local_info() -> dict[str, str]:
+
+@dataclass(frozen=True)
+class GitContext:
+    """Facts about the local checkout, gathered once and reused by every caller."""
+
+    head_branch: str
+    remote_url: str
+
+    @classmethod
+    def detect(cls) -> GitContext:
+        head_branch, remote_url = _get_git_outputs(
+            ["git", "branch", "--show-current"],
+            ["git", "config", "--get", "remote.origin.url"],
+        )
+        return cls(head_branch=head_branch or "unknown", remote_url=remote_url or "")
+
+
+def _load_local_info(git: GitContext) -> dict[str, str]:
     """Infer PR information from the local git repository."""
-    head_branch = _get_git_output(["git", "branch", "--show-current"]) or "unknown"
-    
+    head_branch = git.head_branch
+
     # Try to get repo name from remote origin
-    remote_url = _get_git_output(["git", "config", "--get", "remote.origin.url"])
-    repo_name = "unknown/unknown"
-    if remote_url:
-        # simplistic parsing for git@github.com:user/repo.git or https://github.com/user/repo.git
-        if "github.com" in remote_url:
-            parts = remote_url.replace(".git", "").split("/")
-            if len(parts) >= 2:
-                repo_name = f"{parts[-2].split(':')[-1]}/{parts[-1]}"
+    match = _GITHUB_REMOTE_RE.search(git.remote_url)
+    repo_name = f"{match[1]}/{match[2]}" if match else "unknown/unknown"
 
     return {
         "number": "local",
@@ -110,105 +246,515 @@ def _load_local_info() -> dict[str, str]:
     }
 
 
+def _diff_args(base_branch: str, head_branch: str, pathspecs: bool = True) -> list[str]:
+    args = ["git", "diff", "--no-color", "--no-ext-diff", f"{base_branch}...{head_branch}"]
+    if pathspecs:
+        args += ["--", ".", *DIFF_EXCLUDES]
+    return args
+
+
+@dataclass(frozen=True)
+class DiffSummary:
+    """Digest and size of a PR diff, computed without holding the diff in memory."""
+
+    digest: str
+    size: int
+
+    @property
+    def estimated_tokens(self) -> int:
+        # Roughly four bytes per token for code and English text.
+        return self.size // 4
+
+
+def _summarize_diff(base_branch: str, head_branch: str) -> DiffSummary | None:
+    """Hash and measure the PR diff, or return None if git cannot produce it.
+
+    The diff is hashed as it streams out of git, so memory stays bounded by
+    DIFF_CHUNK_SIZE no matter how large the PR is.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    args = _diff_args(base_branch, head_branch)
+    try:
+        with subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL) as proc:
+            while chunk := proc.stdout.read(DIFF_CHUNK_SIZE):
+                digest.update(chunk)
+                size += len(chunk)
+    except OSError:
+        return None
+    if proc.returncode != 0:
+        return None
+    return DiffSummary(digest=digest.hexdigest(), size=size)
+
+
+def git_changed_and_tracked_files(
+    base_branch: str, head_branch: str
+) -> tuple[list[str], list[str]] | None:
+    """List files the PR adds, copies, modifies, or renames, plus every tracked file.
+
+    Both git queries are independent, so they run concurrently. Returns None if
+    either query fails.
+    """
+    changed, tracked = _get_git_outputs(
+        [
+            "git",
+            "diff",
+            # Match ls-files, which lists paths relative to the working directory.
+            "--relative",
+            "--name-only",
+            "--diff-filter=ACMR",
+            f"{base_branch}...{head_branch}",
+            "--",
+            ".",
+            *DIFF_EXCLUDES,
+        ],
+        ["git", "ls-files"],
+    )
+    if changed is None or tracked is None:
+        return None
+    return changed.splitlines(), tracked.splitlines()
+
+
+def _roll_tree(paths: list[str], keep: set[str]) -> str:
+    """Summarize ``paths`` as a file tree that spells out only the ``keep`` paths.
+
+    Directories without a kept file collapse to ``dir/ (N files)`` and untouched
+    files next to kept ones fold into a ``dir/ (+N files not changed)`` line.
+    """
+    trie: dict[str, dict | None] = {}
+    for path in {*paths, *keep}:
+        node = trie
+        *dirs, name = path.split("/")
+        for part in dirs:
+            node = node.setdefault(part, {})
+        node[name] = None
+
+    kept_dirs = set()
+    for path in keep:
+        parts = path.split("/")
+        kept_dirs.update("/".join(parts[:i]) for i in range(1, len(parts)))
+
+    def count(node: dict) -> int:
+        return sum(1 if child is None else count(child) for child in node.values())
+
+    def files(n: int) -> str:
+        return f"{n} file" if n == 1 else f"{n} files"
+
+    lines: list[str] = []
+
+    def emit(node: dict, prefix: str) -> None:
+        others = 0
+        for name in sorted(node):
+            child = node[name]
+            path = prefix + name
+            if child is None:
+                if path in keep:
+                    lines.append(path)
+                else:
+                    others += 1
+            elif path in kept_dirs:
+                emit(child, f"{path}/")
+            else:
+                lines.append(f"{path}/ ({files(count(child))})")
+        if others:
+            lines.append(f"{prefix or './'} (+{files(others)} not changed)")
+
+    emit(trie, "")
+    return "\n".join(lines)
+
+
+class LLMCache:
+    """On-disk store of past reviews, keyed by a hash of everything that shapes them."""
+
+    def __init__(self, root: Path = CACHE_DIR) -> None:
+        self.root = root
+
+    @staticmethod
+    def key(**parts: object) -> str:
+        # Always the stdlib encoder: keys must not change with whether orjson is installed.
+        payload = json.dumps(parts, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> str | None:
+        try:
+            return _json_loads(self._path(key).read_bytes())["review"]
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def set(self, key: str, review: str) -> None:
+        path = self._path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(".tmp")
+            tmp_path.write_bytes(_json_dumps({"review": review}))
+            tmp_path.replace(path)
+        except OSError as exc:
+            logger.warning("Failed to write review cache entry %s: %s", path, exc)
+
+
+def _dig(data: Any, *keys: str, default: Any = None) -> Any:
+    """Follow ``keys`` into nested dicts; missing, null, or empty values give ``default``."""
+    for key in keys:
+        if not isinstance(data, dict):
+            return default
+        data = data.get(key)
+    return data or default
+
+
 def _load_pr_info(event_path: Path) -> dict[str, str]:
-    with event_path.open("r", encoding="utf-8") as fh:
-        event = json.load(fh)
+    event = _json_loads(event_path.read_bytes())
 
-    pull = event.get("pull_request") or {}
+    pull = _dig(event, "pull_request")
     if not pull:
         raise RuntimeError("Provided event payload does not contain pull_request data.")
 
-    base = pull.get("base", {}) or {}
-    head = pull.get("head", {}) or {}
-    repo = base.get("repo", {}) or {}
-
     return {
-        "number": str(pull.get("number") or event.get("number") or "unknown"),
-        "title": pull.get("title") or "N/A",
-        "body": pull.get("body") or "No description provided",
-        "repo_name": repo.get("full_name") or os.getenv("GITHUB_REPOSITORY") or "unknown/unknown",
-        "base_branch": base.get("ref") or "main",
-        "head_branch": head.get("ref") or "unknown",
+        "number": str(_dig(pull, "number") or _dig(event, "number", default="unknown")),
+        "title": _dig(pull, "title", default="N/A"),
+        "body": _dig(pull, "body", default="No description provided"),
+        "repo_name": _dig(
+            pull,
+            "base",
+            "repo",
+            "full_name",
+            default=os.getenv("GITHUB_REPOSITORY") or "unknown/unknown",
+        ),
+        "base_branch": _dig(pull, "base", "ref", default="main"),
+        "head_branch": _dig(pull, "head", "ref", default="unknown"),
     }
 
 
-def run_openhands_backend(settings: Settings, event_path: Path | None) -> str:
-    if event_path:
-        pr_info = _load_pr_info(event_path)
-    else:
-        logger.info("No event path provided, using local git context.")
-        pr_info = _load_local_info()
+@contextmanager
+def _stdout_to_stderr() -> Iterator[None]:
+    """Send everything written to stdout to stderr, including writes from native code.
 
-    logger.info("Running OpenHands agent for PR #%s: %s", pr_info["number"], pr_info["title"])
+    fd 1 itself is pointed at stderr, so writes skip any Python-level
+    indirection. Falls back to swapping ``sys.stdout`` when the streams have no
+    real file descriptors (e.g. under test capture).
+    """
+    sys.stdout.flush()
+    sys.stderr.flush()
+    try:
+        stdout_fd = sys.stdout.fileno()
+        stderr_fd = sys.stderr.fileno()
+    except (AttributeError, OSError, ValueError):
+        with redirect_stdout(sys.stderr):
+            yield
+        return
 
+    saved_fd = os.dup(stdout_fd)
+    try:
+        os.dup2(stderr_fd, stdout_fd)
+        yield
+    finally:
+        sys.stdout.flush()
+        os.dup2(saved_fd, stdout_fd)
+        os.close(saved_fd)
+
+
+@lru_cache(maxsize=4)
+def _get_llm(model: str, api_key: str, base_url: str):
+    """Build the LLM client once per connection config and reuse it across runs.
+
+    The agent itself is not cached: it binds its tools to the first
+    conversation it runs in, so every review needs a fresh one.
+    """
     llm_config: dict[str, str] = {
-        "model": _prepare_openhands_model(settings.model),
-        "api_key": settings.api_key,
+        "model": model,
+        "api_key": api_key,
         "service_id": "pr_review_agent",
         "drop_params": True,
+        "temperature": REVIEW_TEMPERATURE,
     }
-    if settings.base_url:
-        llm_config["base_url"] = settings.base_url
+    if base_url:
+        llm_config["base_url"] = base_url
+
+    from openhands.sdk import LLM
+
+    return LLM(**llm_config)
+
+
+def run_openhands_backend(
+    settings: Settings,
+    pr_info: dict[str, str],
+    changed_only: bool = False,
+    max_diff_tokens: int = DEFAULT_MAX_DIFF_TOKENS,
+    use_cache: bool = True,
+) -> str:
+    """Run the review agent and return its review."""
+    logger.info("Running OpenHands agent for PR #%s: %s", pr_info["number"], pr_info["title"])
+
+    # One streamed read of the diff gives its cache digest, its size and whether
+    # it is empty; a git failure (e.g. a missing ref) yields None, never "empty".
+    base_branch, head_branch = pr_info["base_branch"], pr_info["head_branch"]
+    diff_summary = _summarize_diff(base_branch, head_branch)
+
+    # An empty diff (e.g. a reverted or lock-file-only PR) needs no model call at all.
+    if diff_summary and diff_summary.size == 0:
+        logger.info("Diff is empty; skipping the OpenHands agent.")
+        return NO_CHANGES_REVIEW
+
+    model = _prepare_openhands_model(settings.model)
+
+    changed_files_section = ""
+    if changed_only:
+        files = git_changed_and_tracked_files(base_branch, head_branch)
+        if files is None:
+            logger.warning("Could not list changed files; reviewing without --changed-only.")
+        elif not files[0]:
+            # e.g. a PR that only deletes files: there is nothing to restrict the review to.
+            logger.info(
+                "PR adds, copies, modifies or renames no files; reviewing without --changed-only."
+            )
+        else:
+            changed_files, tracked_files = files
+            changed_files_section = CHANGED_FILES_SECTION.format(
+                files=_roll_tree(tracked_files, set(changed_files))
+            )
+
+    # The agent gets the exact shell commands we would run, so it never has to
+    # assemble the long exclude pathspecs itself.
+    if diff_summary and diff_summary.estimated_tokens > max_diff_tokens:
+        logger.info(
+            "Diff is about %s tokens; asking the agent to review it file by file.",
+            diff_summary.estimated_tokens,
+        )
+        stat_args = _diff_args(base_branch, head_branch)
+        stat_args.insert(2, "--stat")
+        diff_instructions = LARGE_DIFF_INSTRUCTIONS.format(
+            tokens=diff_summary.estimated_tokens,
+            stat_cmd=shlex.join(stat_args),
+            file_diff_cmd=shlex.join(_diff_args(base_branch, head_branch, pathspecs=False)),
+        )
+    else:
+        diff_instructions = DIFF_INSTRUCTIONS.format(
+            diff_cmd=shlex.join(_diff_args(base_branch, head_branch))
+        )
+    prompt = format_prompt(
+        {
+            **pr_info,
+            "changed_files_section": changed_files_section,
+            "diff_instructions": diff_instructions,
+        }
+    )
 
-    llm = LLM(**llm_config)
+    # Only deterministic runs are worth caching; the diff digest makes a rerun on
+    # the same changes a cache hit even though the agent reads the diff itself.
+    cache = LLMCache()
+    cache_key = None
+    if use_cache and diff_summary and REVIEW_TEMPERATURE <= 0:
+        cache_key = LLMCache.key(
+            version=CACHE_VERSION,
+            model=model,
+            base_url=settings.base_url,
+            temperature=REVIEW_TEMPERATURE,
+            prompt=prompt,
+            diff=diff_summary.digest,
+        )
+        cached_review = cache.get(cache_key)
+        if cached_review:
+            logger.info("Reusing cached review %s", cache_key[:12])
+            return cached_review
+
+    from openhands.sdk import Conversation
+    from openhands.sdk.conversation import get_agent_final_response
+    from openhands.tools.preset.default import get_default_agent
+
+    llm = _get_llm(model, settings.api_key, settings.base_url)
     agent = get_default_agent(llm=llm, cli_mode=True)
     conversation = Conversation(agent=agent, workspace=os.getcwd())
 
-    prompt = OPENHANDS_PROMPT.format(**pr_info)
     conversation.send_message(prompt)
 
     # OpenHands prints the full agent transcript to stdout in CLI mode.
     # Redirect stdout to stderr while the agent runs so our JSON output remains clean.
-    with redirect_stdout(sys.stderr):
+    with _stdout_to_stderr():
         conversation.run()
 
     review_content = get_agent_final_response(conversation.state.events)
     if not review_content:
         raise RuntimeError("OpenHands agent did not return any review content.")
 
-    return review_content.strip()
+    review = review_content.strip()
+    if cache_key:
+        cache.set(cache_key, review)
+    return review
+
+
+def _load_comment_state() -> dict[str, str]:
+    try:
+        state = _json_loads(COMMENT_STATE_PATH.read_bytes())
+    except (OSError, ValueError):
+        return {}
+    return state if isinstance(state, dict) else {}
+
+
+def _save_comment_state(state: dict[str, str]) -> None:
+    try:
+        COMMENT_STATE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        COMMENT_STATE_PATH.write_bytes(_json_dumps(state))
+    except OSError as exc:
+        logger.warning("Failed to save comment state to %s: %s", COMMENT_STATE_PATH, exc)
 
 
-def post_github_comment(
+def _comments_since(listed_at: str | None) -> str | None:
+    """Turn the last recorded listing time into a ``since=`` filter with some slack."""
+    if not listed_at:
+        return None
+    try:
+        since = datetime.fromisoformat(listed_at) - timedelta(minutes=1)
+    except ValueError:
+        return None
+    return since.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+async def post_github_comment(
     review: str, pr_info: dict[str, str], token: str, delete_old_comments: bool = True
 ) -> None:
+    """Post ``review`` on the PR, replacing earlier comments from this bot."""
     if not token:
         logger.warning("No GITHUB_TOKEN provided, skipping comment posting.")
         return
 
+    import httpx
+
     repo = pr_info["repo_name"]
     issue_number = pr_info["number"]
+    comments_url = f"https://api.github.com/repos/{repo}/issues/{issue_number}/comments"
     headers = {
         "Authorization": f"Bearer {token}",
         "Accept": "application/vnd.github.v3+json",
     }
+    state_key = f"{repo}#{issue_number}"
+    state = _load_comment_state()
+
+    # One client for every call: the list, delete and post requests reuse its
+    # keep-alive connections instead of opening one per request.
+    async with httpx.AsyncClient(headers=headers, timeout=30.0) as client:
+        cleaned_up = False
+        listed_at = None
+        if delete_old_comments:
+            found = await _find_old_comments(
+                client, comments_url, _comments_since(state.get(state_key))
+            )
+            if found is not None:
+                stale_ids, listed_at = found
+                cleaned_up = await _delete_comments(client, repo, stale_ids)
+
+        data = {"body": f"{review}\n\n{COMMENT_TAG}"}
 
-    if delete_old_comments:
         try:
-            # List comments on the issue/PR
-            comments_url = f"https://api.github.com/repos/{repo}/issues/{issue_number}/comments"
-            comments_resp = requests.get(comments_url, headers=headers, params={"per_page": 100})
+            response = await client.post(
+                comments_url,
+                content=_json_dumps(data),
+                headers={"Content-Type": "application/json"},
+            )
+            response.raise_for_status()
+            logger.info("Successfully posted review comment to PR #%s", issue_number)
+        except httpx.HTTPError as exc:
+            logger.error("Failed to post review comment: %s", exc)
+            return
+
+    # Every tagged comment that existed when the listing started is now gone, so the
+    # marker may move up to that point. Comments posted after it, including ours and
+    # any from a concurrent run, stay visible to the next since= lookup. A partial
+    # cleanup leaves the marker alone.
+    if cleaned_up and listed_at:
+        state[state_key] = listed_at
+        _save_comment_state(state)
+
+
+async def _find_old_comments(
+    client: httpx.AsyncClient, comments_url: str, since: str | None = None
+) -> tuple[list[int], str | None] | None:
+    """Return the ids of comments on the PR that carry COMMENT_TAG, or None on failure.
+
+    Pages are followed through the ``Link`` header so PRs with more than 100
+    comments are fully covered. The ids come with the time GitHub served the
+    first page, from its ``Date`` header, or None if that header is unusable.
+    """
+    import httpx
+
+    params: dict[str, str | int] | None = {"per_page": 100}
+    if since:
+        params["since"] = since
+
+    # Collect ids from every page before deleting, since deletions would shift
+    # later pages and cause comments to be skipped.
+    stale_ids: list[int] = []
+    listed_at = None
+    url: str | None = comments_url
+    try:
+        while url:
+            comments_resp = await client.get(url, params=params)
             comments_resp.raise_for_status()
+            if params is not None:
+                listed_at = _server_time(comments_resp)
+            page = _json_loads(comments_resp.content)
+            if not isinstance(page, list):
+                raise ValueError(f"expected a list of comments, got {type(page).__name__}")
+            stale_ids.extend(
+                comment["id"]
+                for comment in page
+                if isinstance(comment, dict)
+                and "id" in comment
+                and isinstance(comment.get("body"), str)
+                and COMMENT_TAG in comment["body"]
+            )
+            # The next link already carries the query string.
+            url = comments_resp.links.get("next", {}).get("url")
+            params = None
+    except (httpx.HTTPError, ValueError) as exc:
+        # A listing that is not a JSON array of comments is treated like a failed request.
+        logger.warning("Failed to delete old comments: %s", exc)
+        return None
+    return stale_ids, listed_at
+
+
+def _server_time(response: httpx.Response) -> str | None:
+    """Return the response's ``Date`` header as an ISO timestamp, if it parses."""
+    try:
+        return parsedate_to_datetime(response.headers["date"]).isoformat()
+    except (KeyError, TypeError, ValueError):
+        return None
 
-            # Delete comments that contain the tag
-            for comment in comments_resp.json():
-                if COMMENT_TAG in (comment.get("body") or ""):
-                    delete_url = f"https://api.github.com/repos/{repo}/issues/comments/{comment['id']}"
-                    delete_resp = requests.delete(delete_url, headers=headers)
-                    delete_resp.raise_for_status()
-                    logger.info("Deleted old comment %s", comment["id"])
-        except requests.exceptions.RequestException as exc:
-            logger.warning("Failed to delete old comments: %s", exc)
 
-    url = f"https://api.github.com/repos/{repo}/issues/{issue_number}/comments"
-    data = {"body": f"{review}\n\n{COMMENT_TAG}"}
+async def _delete_comments(client: httpx.AsyncClient, repo: str, comment_ids: list[int]) -> bool:
+    """Delete ``comment_ids`` concurrently; return True if every delete succeeded."""
+    import httpx
+
+    limit = asyncio.Semaphore(MAX_CONCURRENT_DELETES)
+
+    async def delete(comment_id: int) -> bool:
+        delete_url = f"https://api.github.com/repos/{repo}/issues/comments/{comment_id}"
+        try:
+            async with limit:
+                response = await client.delete(delete_url)
+            response.raise_for_status()
+            logger.info("Deleted old comment %s", comment_id)
+            return True
+        except httpx.HTTPError as exc:
+            logger.warning("Failed to delete old comment %s: %s", comment_id, exc)
+            return False
+
+    results = await asyncio.gather(*(delete(comment_id) for comment_id in comment_ids))
+    return all(results)
 
-    try:
-        response = requests.post(url, headers=headers, json=data)
-        response.raise_for_status()
-        logger.info("Successfully posted review comment to PR #%s", issue_number)
-    except requests.exceptions.RequestException as exc:
-        logger.error("Failed to post review comment: %s", exc)
+
+def _configure_logging() -> None:
+    """Give this module's logger its own stderr handler.
+
+    OpenHands configures the root logger only once it is imported, which no
+    longer happens for cache hits, empty diffs, or config errors.
+    """
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("[open-pr-agent] %(levelname)s: %(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
 
 
 def main() -> None:
@@ -234,10 +780,31 @@ def main() -> None:
         default=True,
         help="Whether to delete old review comments from this bot. Defaults to True.",
     )
+    parser.add_argument(
+        "--changed-only",
+        action="store_true",
+        help="List the files changed by the PR in the prompt and restrict the review to them.",
+    )
+    parser.add_argument(
+        "--max-diff-tokens",
+        type=int,
+        default=os.getenv("AGENT_MAX_DIFF_TOKENS", str(DEFAULT_MAX_DIFF_TOKENS)),
+        help=(
+            "Estimated diff size above which the agent reviews file by file instead of reading "
+            f"the whole diff (defaults to AGENT_MAX_DIFF_TOKENS or {DEFAULT_MAX_DIFF_TOKENS})."
+        ),
+    )
+    parser.add_argument(
+        "--cache",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="Whether to reuse and store reviews in the on-disk review cache. Defaults to True.",
+    )
     args = parser.parse_args()
+    _configure_logging()
 
     try:
-        settings = Settings()
+        settings = get_settings()
     except Exception as exc:
         print(f"Failed to load settings: {exc}", file=sys.stderr)
         raise SystemExit(1) from exc
@@ -248,25 +815,33 @@ def main() -> None:
         if not event_path.is_file():
             raise SystemExit(f"Provided event path '{args.event_path}' does not exist.")
 
-    review = run_openhands_backend(settings, event_path)
+    if event_path:
+        pr_info = _load_pr_info(event_path)
+    else:
+        logger.info("No event path provided, using local git context.")
+        pr_info = _load_local_info(GitContext.detect())
+
+    post_comment = event_path is not None and bool(args.github_token)
+    if event_path and not args.github_token:
+        logger.warning("No GITHUB_TOKEN provided. Skipping comment posting.")
+    elif not event_path and args.github_token:
+        logger.warning("Cannot post comment without event payload (local mode).")
+
+    review = run_openhands_backend(
+        settings, pr_info, args.changed_only, args.max_diff_tokens, args.cache
+    )
 
     try:
-        Path(args.output_path).write_text(f"{review.strip()}\n", encoding="utf-8")
+        Path(args.output_path).write_text(f"{review}\n", encoding="utf-8")
     except OSError as exc:
         raise SystemExit(f"Failed to write agent output to {args.output_path}: {exc}") from exc
 
     print(f"OpenHands review written to {args.output_path}")
 
-    if event_path:
-        if not args.github_token:
-            logger.warning("No GITHUB_TOKEN provided. Skipping comment posting.")
-        else:
-            pr_info = _load_pr_info(event_path)
-            post_github_comment(
-                review, pr_info, args.github_token, args.delete_old_comments
-            )
-    elif args.github_token:
-        logger.warning("Cannot post comment without event payload (local mode).")
+    if post_comment:
+        asyncio.run(
+            post_github_comment(review, pr_info, args.github_token, args.delete_old_comments)
+        )
 
 
 if __name__ == "__main__":